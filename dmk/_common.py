@@ -2,10 +2,9 @@
 # SPDX-License-Identifier: MIT
 
 
+import hashlib
 from typing import BinaryIO, Tuple
 
-from Crypto.Hash import BLAKE2s
-
 KEY_SIZE = 32
 assert KEY_SIZE * 8 == 256
 
@@ -30,6 +29,13 @@ CLUSTER_META_SIZE = 59
 MAX_CLUSTER_CONTENT_SIZE = CLUSTER_SIZE - CLUSTER_META_SIZE
 assert MAX_CLUSTER_CONTENT_SIZE <= CLUSTER_SIZE
 
+# buffer size for the new vault file, that is written sequentially, block
+# after block, and may be much larger than a single entry. With the default
+# 8 KiB buffer it would be a system call for every couple of blocks.
+# Other files use the default buffering: the old vault is read from a memory
+# map, and a single entry is too small to benefit from a larger buffer
+IO_BUFFER_SIZE = 1024 * 1024
+
 
 def read_or_fail(f: BinaryIO, n: int) -> bytes:
     result = f.read(n)
@@ -53,7 +59,7 @@ def half_n_half(salt: bytes) -> Tuple[bytes, bytes]:
 
 
 def blake2s_256(data: bytes, salt: bytes) -> bytes:
-    h_obj = BLAKE2s.new(digest_bits=256)
+    h_obj = hashlib.blake2s(digest_size=32)
     a, b = half_n_half(salt)
     h_obj.update(a + data + b)
     return h_obj.digest()
@@ -3,22 +3,28 @@
 
 
 import io
+import os
+from contextlib import contextmanager
 from io import BytesIO
 from pathlib import Path
-from typing import BinaryIO, Optional
+from typing import BinaryIO, Optional, Iterator, List
 
-from Crypto.Random import get_random_bytes
-
-from ._common import KEY_SALT_SIZE
+from ._common import KEY_SALT_SIZE, IO_BUFFER_SIZE
 from .a_base import CodenameKey
 from .a_utils.dirty_file import WritingToTempFile
-from .b_cryptoblobs import decrypt_from_dios
+from .a_utils.single_flight import SingleFlight
+from .b_cryptoblobs import decrypt_from_dios, DecryptedIO
 from .b_storage_file import StorageFileReader, StorageFileWriter, \
     BlocksIndexedReader
 from .c_namegroups import NameGroup, update_namegroup_b
 from .c_namegroups._update import add_fakes
 
 
+# concurrent reads of the same entry from the same version of the file
+# (for example, in a server process) are decrypted only once
+_inflight_reads = SingleFlight()
+
+
 class DmkFile:
     def __init__(self, path: Path):
         self.path = path
@@ -31,7 +37,7 @@ class DmkFile:
                 with self.path.open('rb') as f:
                     self._salt = StorageFileReader(f).salt
             except FileNotFoundError:
-                self._salt = get_random_bytes(KEY_SALT_SIZE)
+                self._salt = os.urandom(KEY_SALT_SIZE)
         assert self._salt is not None
         return self._salt
 
@@ -63,7 +69,8 @@ class DmkFile:
         ck = CodenameKey(codename, self.salt)
         with WritingToTempFile(self.path) as wtf:
             with self._old_blobs() as old_blobs, \
-                    wtf.dirty.open('wb') as new_file_io, \
+                    wtf.dirty.open('wb', buffering=IO_BUFFER_SIZE) \
+                    as new_file_io, \
                     StorageFileWriter(new_file_io, self.salt) as writer:
                 add_fakes(ck,
                           old_blobs,
@@ -76,25 +83,65 @@ class DmkFile:
         ck = CodenameKey(codename, self.salt)
         with WritingToTempFile(self.path) as wtf:
             with self._old_blobs() as old_blobs, \
-                    wtf.dirty.open('wb') as new_file_io, \
+                    wtf.dirty.open('wb', buffering=IO_BUFFER_SIZE) \
+                    as new_file_io, \
                     StorageFileWriter(new_file_io, self.salt) as writer:
                 update_namegroup_b(ck, source, old_blobs, writer.blobs)
             # both files are closed now
             wtf.commit()
 
-    def get_bytes(self, codename: str) -> Optional[bytes]:
+    @contextmanager
+    def _fresh_content_dios(self, codename: str) \
+            -> Iterator[List[DecryptedIO]]:
         ck = CodenameKey(codename, self.salt)
         with self._old_blobs() as old_blobs:
-            ng = NameGroup(old_blobs, ck)
+            yield NameGroup(old_blobs, ck).fresh_content_dios
 
-            if not ng.fresh_content_dios:
+    def get_bytes(self, codename: str) -> Optional[bytes]:
+        try:
+            file_stat = self.path.stat()
+        except FileNotFoundError:
+            return None
+        ck = CodenameKey(codename, self.salt)
+        # when the file is replaced, at least the inode changes
+        read_key = (str(self.path.absolute()),
+                    file_stat.st_ino,
+                    file_stat.st_size,
+                    file_stat.st_mtime_ns,
+                    ck.as_bytes)
+        return _inflight_reads.run(read_key,
+                                   lambda: self._get_bytes_now(codename))
+
+    def _get_bytes_now(self, codename: str) -> Optional[bytes]:
+        with self._fresh_content_dios(codename) as dios:
+            if not dios:
                 return None
 
             with BytesIO() as decrypted:
-                decrypt_from_dios(ng.fresh_content_dios, decrypted)
+                decrypt_from_dios(dios, decrypted)
                 decrypted.seek(0, io.SEEK_SET)
                 return decrypted.read()
 
+    def get_to_file(self, codename: str, target_file: Path) -> bool:
+        """Decrypts the entry directly to a new `target_file`, part by part.
+        The parts go to the file through the default (small) file buffer, so
+        the whole decrypted entry is not kept in memory.
+
+        Returns False if the entry does not exist. The file is not created
+        in this case."""
+        with self._fresh_content_dios(codename) as dios:
+            if not dios:
+                return False
+            with target_file.open('xb') as target_io:
+                try:
+                    decrypt_from_dios(dios, target_io)
+                except BaseException:
+                    # not leaving partially decrypted data
+                    target_io.close()
+                    target_file.unlink()
+                    raise
+            return True
+
     def set_bytes(self, codename: str, data: bytes):
         # todo test
         with BytesIO(data) as bytes_io:
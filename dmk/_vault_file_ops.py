@@ -34,13 +34,9 @@ def get_file(dmk_file: DmkFile,
     if target_file.exists():
         raise FileExistsError
 
-    decrypted_bytes = dmk_file.get_bytes(codename)  # todo get io, chunks?
-    if decrypted_bytes is None:
+    if not dmk_file.get_to_file(codename, Path(target_file)):
         raise DmkKeyError
 
-    with Path(target_file).open('wb') as target_io:
-        target_io.write(decrypted_bytes)
-
 
 class DmkKeyError(KeyError):
     pass
\ No newline at end of file
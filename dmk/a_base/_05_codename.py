@@ -2,7 +2,7 @@
 # SPDX-License-Identifier: MIT
 
 
-from Crypto.Random import get_random_bytes
+import os
 
 from dmk._common import CODENAME_LENGTH_BYTES
 
@@ -18,7 +18,7 @@ class CodenameAscii:
         if length > CODENAME_LENGTH_BYTES:
             raise ValueError(f"Too long: {length}>{CODENAME_LENGTH_BYTES}")
         elif length < CODENAME_LENGTH_BYTES:
-            padding = get_random_bytes(CODENAME_LENGTH_BYTES - length - 1)
+            padding = os.urandom(CODENAME_LENGTH_BYTES - length - 1)
             result = padding + b'\0' + result
         assert len(result) == CODENAME_LENGTH_BYTES
         return result
@@ -10,8 +10,6 @@ import struct
 from base64 import b32encode, urlsafe_b64encode, urlsafe_b64decode
 from pathlib import Path
 
-from Crypto.Random import get_random_bytes
-
 from dmk._common import CODENAME_LENGTH_BYTES
 
 
@@ -21,7 +19,7 @@ def get_noncrypt_random_bytes(
         n: int,
         _struct8k=struct.Struct("!1000Q").pack_into) -> bytes:
     # For n = 1M it's six times faster
-    # than urandom (aka Crypto.Random.get_random_bytes)
+    # than os.urandom
     # Original:
     #   https://stackoverflow.com/a/43788050
     #   by Richard Thiessen, CC BY-SA 3.0
@@ -102,7 +100,7 @@ def unique_filename_old(parent: Path) -> Path:
         # length is not secure, but bytes are.
         # How to make the length secure?
         length = random.randint(1, 12)
-        basename = bytes_to_fn_str(get_random_bytes(length))
+        basename = bytes_to_fn_str(os.urandom(length))
         file = parent / basename
         if not file.exists():
             return file
@@ -0,0 +1,63 @@
+# SPDX-FileCopyrightText: (c) 2021 Artёm IG <github.com/rtmigo>
+# SPDX-License-Identifier: MIT
+
+
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional, TypeVar
+
+T = TypeVar('T')
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.succeeded = False
+        self.result: Any = None
+        # number of threads waiting for the result (not counting the leader)
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Runs a function once for all the threads that request the same key
+    at the same time. The first thread computes the result, the others wait
+    for it.
+
+    Results are not cached: after the computation is finished, the next call
+    with the same key will compute again. So decrypted data is not kept in
+    memory longer than the callers keep it.
+
+    If the computation fails, one of the waiting threads becomes the new
+    leader and computes again, while the others wait for it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: Dict[Hashable, _Flight] = {}
+
+    def run(self, key: Hashable, func: Callable[[], T]) -> T:
+        while True:
+            with self._lock:
+                flight: Optional[_Flight] = self._flights.get(key)
+                is_leader = flight is None
+                if flight is None:
+                    flight = _Flight()
+                    self._flights[key] = flight
+                else:
+                    flight.waiters += 1
+
+            if is_leader:
+                try:
+                    flight.result = func()
+                    flight.succeeded = True
+                    return flight.result
+                finally:
+                    with self._lock:
+                        del self._flights[key]
+                    flight.done.set()
+
+            flight.done.wait()
+            if flight.succeeded:
+                return flight.result
+            # The exception was raised in the leader thread. We will not
+            # share the exception object. Instead, we start a new flight
+            # or join the one started by another waiting thread
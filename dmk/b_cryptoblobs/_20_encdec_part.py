@@ -2,14 +2,17 @@
 # SPDX-License-Identifier: MIT
 
 
+import hashlib
 import io
+import os
+import stat
+import struct
 import zlib
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional, NamedTuple, BinaryIO
 
-from Crypto.Cipher import ChaCha20
-from Crypto.Hash import BLAKE2s
-from Crypto.Random import get_random_bytes
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms
 
 from dmk._common import read_or_fail, InsufficientData, \
     MAX_CLUSTER_CONTENT_SIZE, CLUSTER_SIZE, CLUSTER_META_SIZE, \
@@ -19,9 +22,7 @@ from dmk.a_utils.bytes import bytes_to_str
 from dmk.a_utils.dirty_file import WritingToTempFile
 from dmk.a_utils.randoms import set_random_last_modified, \
     get_noncrypt_random_bytes
-from dmk.b_cryptoblobs._10_byte_funcs import bytes_to_uint32, \
-    uint32_to_bytes, uint16_to_bytes, \
-    bytes_to_uint16, uint48_to_bytes, bytes_to_uint48
+from dmk.b_cryptoblobs._10_byte_funcs import bytes_to_uint32
 
 _DEBUG_PRINT = False
 
@@ -42,12 +43,15 @@ class ItemImprintMismatch(Exception):
 # 96-bit nonce
 ENCRYPTION_NONCE_LEN = 12  # 96-bit
 
+# each block starts with unencrypted nonce and imprint
+NONCE_AND_IMPRINT_SIZE = ENCRYPTION_NONCE_LEN + IMPRINT_SIZE
+
 
 # HEADER_CHECKSUM_LEN = 21
 
 
 def blake2s(data: bytes, target_size_bytes: int) -> bytes:
-    h_obj = BLAKE2s.new(digest_bits=target_size_bytes * 8)
+    h_obj = hashlib.blake2s(digest_size=target_size_bytes)
     h_obj.update(data)
     result = h_obj.digest()
     assert len(result) == target_size_bytes
@@ -60,15 +64,32 @@ class Cryptographer:
                  nonce: Optional[bytes]):
         self.fpk = fpk
         if nonce is None:
-            nonce = get_random_bytes(ENCRYPTION_NONCE_LEN)
+            nonce = os.urandom(ENCRYPTION_NONCE_LEN)
 
         if len(nonce) != ENCRYPTION_NONCE_LEN:
             raise ValueError("Unexpected nonce length")
-        self.cipher = ChaCha20.new(key=self.fpk.as_bytes, nonce=nonce)
+        self._nonce = nonce
+
+        # OpenSSL implementation of ChaCha20 (RFC 7539). It expects a 128-bit
+        # value: 32-bit initial block counter (little-endian) followed by
+        # the 96-bit nonce. With zero counter the keystream is the same
+        # as we had with PyCryptodome, so the stored data remains compatible.
+        #
+        # ChaCha20 is a stream cipher: both encryption and decryption are XOR
+        # with the keystream. So one context serves both directions.
+        self._keystream = Cipher(
+            algorithms.ChaCha20(self.fpk.as_bytes, bytes(4) + nonce),
+            mode=None).encryptor()
 
     @property
-    def nonce(self):
-        return self.cipher.nonce
+    def nonce(self) -> bytes:
+        return self._nonce
+
+    def encrypt(self, data: bytes) -> bytes:
+        return self._keystream.update(data)
+
+    def decrypt(self, data: bytes) -> bytes:
+        return self._keystream.update(data)
 
     def __str__(self):
         return '\n'.join([
@@ -91,6 +112,21 @@ class Header(NamedTuple):
 
 
 def get_stream_size(stream: BinaryIO) -> int:
+    if isinstance(stream, io.BytesIO):
+        with stream.getbuffer() as buffer:
+            return buffer.nbytes
+
+    # for regular files opened for reading, the size is known to the file
+    # system. We avoid seeking, so the read-ahead buffer is kept intact
+    try:
+        fileno: Optional[int] = stream.fileno()
+    except (OSError, NotImplementedError):
+        fileno = None
+    if fileno is not None and not stream.writable():
+        file_stat = os.fstat(fileno)
+        if stat.S_ISREG(file_stat.st_mode):
+            return file_stat.st_size
+
     pos = stream.seek(0, io.SEEK_CUR)
     size = stream.seek(0, io.SEEK_END)
     stream.seek(pos, io.SEEK_SET)
@@ -122,10 +158,41 @@ def get_lower15bits(x: int) -> int:
 
 FAKE_CONTENT_VERSION = 0xFFFFFFFFFFFF
 
+# CONTENT_CRC32 (uint32), FORMAT_VER (uint8), PART_IDX (uint16),
+# PART_SIZE (uint16), ITEM_VER (uint48).
+#
+# There is no 48-bit integer in struct, so ITEM_VER is packed as the higher
+# 16 bits followed by the lower 32 bits. In big-endian these are the same
+# bytes as uint48_to_bytes would give.
+_HEADER_STRUCT = struct.Struct('>IBHHHI')
+assert _HEADER_STRUCT.size == HEADER_SIZE
+
+
+@lru_cache(maxsize=16)
+def _imprint_hash_prefix(key: bytes) -> hashlib.blake2s:
+    # The imprint is a hash of KEY+NONCE. We hash the key part once, and
+    # then only copy the state for each nonce. The imprints are computed
+    # for every block in the file, always with the same key
+    h_obj = hashlib.blake2s(digest_size=IMPRINT_SIZE)
+    h_obj.update(key)
+    return h_obj
+
 
-def to_imprint(cnk: CodenameKey, nonce: bytes):
+def to_imprint(cnk: CodenameKey, nonce: bytes) -> bytes:
     assert len(nonce) == ENCRYPTION_NONCE_LEN
-    return blake2s(cnk.as_bytes + nonce, IMPRINT_SIZE)
+    h_obj = _imprint_hash_prefix(cnk.as_bytes).copy()
+    h_obj.update(nonce)
+    return h_obj.digest()
+
+
+def imprint_matches(cnk: CodenameKey, block_head: bytes) -> bool:
+    """Checks whether the block belongs to the codename by the first
+    NONCE_AND_IMPRINT_SIZE bytes of the block. Unlike `DecryptedIO`, it
+    does not need a stream."""
+    if len(block_head) != NONCE_AND_IMPRINT_SIZE:
+        raise ValueError(f"Unexpected length: {len(block_head)}")
+    return to_imprint(cnk, block_head[:ENCRYPTION_NONCE_LEN]) \
+           == block_head[ENCRYPTION_NONCE_LEN:]
 
 
 class Encrypt:
@@ -238,13 +305,13 @@ class Encrypt:
 
         is_fake = source is None
 
-        nonce = get_random_bytes(ENCRYPTION_NONCE_LEN)
+        nonce = os.urandom(ENCRYPTION_NONCE_LEN)
 
         # ITEM_VER
         if is_fake:
-            content_ver_bytes = uint48_to_bytes(FAKE_CONTENT_VERSION)
+            content_ver = FAKE_CONTENT_VERSION
         else:
-            content_ver_bytes = uint48_to_bytes(self.data_version)
+            content_ver = self.data_version
 
         # PART_SIZE
         if self.part_size is None:
@@ -272,17 +339,14 @@ class Encrypt:
         ##########
 
         body_bytes: Optional[bytes]
-        body_crc_bytes: bytes
+        body_crc: int
         if is_fake:
             body_bytes = None
-            body_crc_bytes = get_random_bytes(4)
+            body_crc = bytes_to_uint32(os.urandom(4))
         else:
             assert source is not None
             body_bytes = read_or_fail(source, self.part_size)
-            body_crc_bytes = uint32_to_bytes(zlib.crc32(body_bytes))
-
-        part_idx_bytes = uint16_to_bytes(self.part_idx)
-        part_size_bytes = uint16_to_bytes(part_is_last_and_size)
+            body_crc = zlib.crc32(body_bytes)
 
         # codename_data = CodenameAscii.to_padded_ascii(self.cnk.codename)
 
@@ -307,19 +371,17 @@ class Encrypt:
         assert outfile.seek(0, io.SEEK_CUR) <= 1024
 
         def encrypt_and_write(data: bytes):
-            outfile.write(cryptographer.cipher.encrypt(data))
+            outfile.write(cryptographer.encrypt(data))
 
-        version = bytes((1,))
+        version = 1
 
-        header_data = b''.join((
-            # codename_data,
-            body_crc_bytes,
+        header_data = _HEADER_STRUCT.pack(
+            body_crc,
             version,
-
-            part_idx_bytes,
-            part_size_bytes,
-            content_ver_bytes,
-        ))
+            self.part_idx,
+            part_is_last_and_size,
+            content_ver >> 32,
+            content_ver & 0xFFFFFFFF)
 
         assert len(header_data) == HEADER_SIZE, len(header_data)
 
@@ -380,18 +442,23 @@ class DecryptedIO:
 
     def __init__(self,
                  fpk: CodenameKey,
-                 source: BinaryIO):
+                 source: BinaryIO,
+                 nonce_and_imprint: Optional[bytes] = None):
+        """If the first NONCE_AND_IMPRINT_SIZE bytes of the block are already
+        read, they can be passed as `nonce_and_imprint`. Then they will not
+        be read from the `source` again."""
         self.fpk = fpk
         self._source = source
 
         self._nonce: Optional[bytes] = None
         self._imprint: Optional[bytes] = None
 
+        if nonce_and_imprint is not None:
+            self.__split_nonce_and_imprint(nonce_and_imprint)
+
         self._header: Optional[Header] = None
         self._tried_to_read_header = False
-
-        self._data_read = False
-        self._data = None
+        self._keystream_at_body = False
 
         pos = self._source.tell()
         if pos != 0:
@@ -402,22 +469,33 @@ class DecryptedIO:
         assert encrypted is not None
         if len(encrypted) < n:
             raise InsufficientData
-        return self.cfg.cipher.decrypt(encrypted)
+        return self.cfg.decrypt(encrypted)
+
+    def __read_nonce_and_imprint(self):
+        # both are unencrypted and go one after another, so we read them
+        # with a single call
+        _expect_position(self._source, 0)
+        self.__split_nonce_and_imprint(
+            read_or_fail(self._source, NONCE_AND_IMPRINT_SIZE))
+
+    def __split_nonce_and_imprint(self, data: bytes):
+        if len(data) != NONCE_AND_IMPRINT_SIZE:
+            raise ValueError(f"Unexpected length: {len(data)}")
+        self._nonce = data[:ENCRYPTION_NONCE_LEN]
+        self._imprint = data[ENCRYPTION_NONCE_LEN:]
 
     @property
     def nonce(self) -> bytes:
         if self._nonce is None:
-            _expect_position(self._source, 0)
-            self._nonce = read_or_fail(self._source, ENCRYPTION_NONCE_LEN)
+            self.__read_nonce_and_imprint()
+        assert self._nonce is not None
         return self._nonce
 
     @property
     def imprint(self) -> bytes:
-
         if self._imprint is None:
-            _ = self.nonce
-            _expect_position(self._source, ENCRYPTION_NONCE_LEN)
-            self._imprint = read_or_fail(self._source, IMPRINT_SIZE)
+            self.__read_nonce_and_imprint()
+        assert self._imprint is not None
         return self._imprint
 
     @property
@@ -426,8 +504,9 @@ class DecryptedIO:
 
     @property
     def contains_data(self) -> bool:
-        return self.header_opt is not None \
-               and self.header_opt.data_version != FAKE_CONTENT_VERSION
+        header = self.header_opt
+        return header is not None \
+               and header.data_version != FAKE_CONTENT_VERSION
 
     @property
     def header(self) -> Header:
@@ -454,6 +533,9 @@ class DecryptedIO:
             raise VerificationFailure
 
         self.cfg = Cryptographer(fpk=self.fpk, nonce=self.nonce)
+        # the nonce and imprint may have been passed to the constructor
+        # instead of reading them from the stream
+        self._source.seek(NONCE_AND_IMPRINT_SIZE, io.SEEK_SET)
 
         if _DEBUG_PRINT:
             print("---")
@@ -461,42 +543,28 @@ class DecryptedIO:
             print(self.cfg)
             print("---")
 
-        body_crc32_data = self.__read_and_decrypt(4)
-        format_version_data = self.__read_and_decrypt(1)
+        # the whole header is decrypted at once and unpacked by one call
+        (content_crc32,
+         format_version,
+         part_idx,
+         last_and_size,
+         content_version_high,
+         content_version_low) = _HEADER_STRUCT.unpack(
+            self.__read_and_decrypt(HEADER_SIZE))
+
+        assert self._source.tell() == CLUSTER_META_SIZE, self._source.tell()
+        self._keystream_at_body = True
 
         # after reading the format version version we can choose different
         # paths. Do not forget that this may not be a version, but random data.
         # And there are no different ways yet: there is only one block format
         # version.
+        assert format_version == 1
 
-        part_idx_data = self.__read_and_decrypt(2)
-        part_size_data = self.__read_and_decrypt(2)
-        content_version_data = self.__read_and_decrypt(6)
-        # header_checksum = self.__read_and_decrypt(HEADER_CHECKSUM_LEN)
-
-        # todo read whole header data, then re-read from bytesio?
-
-        header_data = b''.join((
-            # codename_data,
-            body_crc32_data,
-            format_version_data,
-
-            part_idx_data,
-            part_size_data,
-            content_version_data,
-        ))
-
-        assert len(header_data) == HEADER_SIZE, len(header_data)
-
-        assert format_version_data[0] == 1
-        part_idx = bytes_to_uint16(part_idx_data)
-
-        last_and_size = bytes_to_uint16(part_size_data)
         part_size = get_lower15bits(last_and_size)
         is_last = get_highest_bit_16(last_and_size)
 
-        content_version = bytes_to_uint48(content_version_data)
-        content_crc32 = bytes_to_uint32(body_crc32_data)
+        content_version = (content_version_high << 32) | content_version_low
 
         return Header(content_crc32=content_crc32,
                       data_version=content_version,
@@ -509,41 +577,32 @@ class DecryptedIO:
                       valid=True)
 
     def read_data(self) -> bytes:
-        # todo remove
-        result = self.data
-        if result is None:
-            raise TypeError
-        return result
-        # if self._data_read:
-        #     raise RuntimeError("Cannot read data more than once")
-        #
-        # if not self.contains_data:
-        #     raise RuntimeError("contains_data is False")
-        #
-        # assert self._source.tell() == CLUSTER_META_SIZE, f"pos is {self._source.tell()}"
-        #
-        # body = self.__read_and_decrypt(self.header.part_size)
-        # if zlib.crc32(body) != self.header.content_crc32:
-        #     raise VerificationFailure("Body CRC mismatch.")
-        #
-        # self._data_read = True
-        # return body
-
-    @property
-    def data(self):
-        if self._data_read:
-            return self._data
-        assert not self._data_read
-
-        self._data_read = True
-        if self.contains_data:
-            assert self._source.tell() == CLUSTER_META_SIZE, f"pos is {self._source.tell()}"
-
-            self._data = self.__read_and_decrypt(self.header.part_size)
-            if zlib.crc32(self._data) != self.header.content_crc32:
-                raise VerificationFailure("Body CRC mismatch.")
-
-            return self._data
+        """Reads, decrypts and verifies the body.
+
+        The body is not kept in the object, so each call reads and decrypts
+        it again. Normally it is called once per block, when the entry is
+        decrypted."""
+        if not self.contains_data:
+            raise RuntimeError("contains_data is False")
+
+        if self._keystream_at_body:
+            # The first call continues the keystream right after the header
+            self._keystream_at_body = False
+            self._source.seek(CLUSTER_META_SIZE, io.SEEK_SET)
+            body = self.__read_and_decrypt(self.header.part_size)
+        else:
+            # The cipher is a stream, and its keystream is already advanced.
+            # We start a new keystream from the beginning of the encrypted
+            # area and skip the header
+            self._source.seek(NONCE_AND_IMPRINT_SIZE, io.SEEK_SET)
+            cfg = Cryptographer(fpk=self.fpk, nonce=self.nonce)
+            encrypted = read_or_fail(self._source,
+                                     HEADER_SIZE + self.header.part_size)
+            body = cfg.decrypt(encrypted)[HEADER_SIZE:]
+
+        if zlib.crc32(body) != self.header.content_crc32:
+            raise VerificationFailure("Body CRC mismatch.")
+        return body
 
     # def verify_data(self) -> bool:
     #     """This can be called before removing an old block.
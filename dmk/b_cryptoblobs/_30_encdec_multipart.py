@@ -3,7 +3,6 @@
 
 
 import io
-import zlib
 from pathlib import Path
 from typing import BinaryIO, List, Set
 
@@ -45,9 +44,9 @@ class MultipartEncryptor:
         self.part_sizes = split_cluster_sizes(full_size)
         assert sum(self.part_sizes) == full_size
 
+        # each part has its own CRC-32 inside the encrypted header, so we do
+        # not read the whole source for a separate checksum
         assert self._source_bytesio.tell() == 0
-        self.source_crc = zlib.crc32(self._source_bytesio.read())
-        self._source_bytesio.seek(0, io.SEEK_SET)
 
         self.encrypted_indices: Set[int] = set()
 
@@ -2,5 +2,6 @@
 # SPDX-License-Identifier: MIT
 
 
-from ._20_encdec_part import DecryptedIO
+from ._20_encdec_part import DecryptedIO, imprint_matches, \
+    NONCE_AND_IMPRINT_SIZE
 from ._30_encdec_multipart import MultipartEncryptor, decrypt_from_dios
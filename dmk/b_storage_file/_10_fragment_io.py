@@ -134,7 +134,8 @@ class FragmentIO(BinaryIO):
         raise NotImplementedError
 
     def writable(self) -> bool:
-        return self.underlying.writable()
+        # the fragment is read-only, even if the underlying stream is not
+        return False
 
     def writelines(self, lines: List[AnyStr]) -> None:  # type: ignore
         raise NotImplementedError
@@ -5,11 +5,11 @@
 from __future__ import annotations
 
 import io
+import mmap
+import os
 import random
 from typing import BinaryIO, Optional, Iterable
 
-from Crypto.Random import get_random_bytes
-
 from dmk._common import read_or_fail, CLUSTER_SIZE
 from dmk.b_storage_file._10_fragment_io import FragmentIO
 
@@ -45,7 +45,7 @@ class BlocksSequentialWriter:
         if self._tail_written:
             raise RuntimeError("Cannot run this after tail written")
 
-        tail = get_random_bytes(random.randint(1, CLUSTER_SIZE - 1))
+        tail = os.urandom(random.randint(1, CLUSTER_SIZE - 1))
         assert 1 <= len(tail) < CLUSTER_SIZE
         self.target_io.write(tail)
         self._tail_written = True
@@ -66,13 +66,32 @@ class BlocksIndexedReader:
         self._len = (self._io_size - self._start_pos) // CLUSTER_SIZE
         self.source_io.seek(self._start_pos, io.SEEK_SET)
 
+        self._mmap: Optional[mmap.mmap] = None
+        self._mmap_tried = False
+        self._mapped_io: Optional[_MappedIO] = None
+
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
+        self._mapped_io = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
         if self.close_stream:
             self.source_io.close()
 
+    def _mapped(self) -> Optional[mmap.mmap]:
+        """If the source is a real file, we map it to memory once and read
+        the blocks from the map. Otherwise we read them from the stream.
+
+        Reading from the map does not need `seek` and `read` system calls,
+        so scanning N blocks costs N memory copies."""
+        if not self._mmap_tried:
+            self._mmap_tried = True
+            self._mmap = _mmap_or_none(self.source_io)
+        return self._mmap
+
     def __len__(self):
         return self._len
 
@@ -80,6 +99,18 @@ class BlocksIndexedReader:
     def tail_size(self):
         return (self._io_size - self._start_pos) - len(self) * CLUSTER_SIZE
 
+    def read_head(self, idx: int, size: int) -> bytes:
+        """Returns the first `size` bytes of the block `idx`."""
+        if not 0 <= size <= CLUSTER_SIZE:
+            raise ValueError(f"size={size}")
+        mapped = self._mapped()
+        if mapped is not None:
+            if not 0 <= idx < len(self):
+                raise IndexError(idx)
+            start = self._start_pos + idx * CLUSTER_SIZE
+            return mapped[start:start + size]
+        return read_or_fail(self.io(idx), size)
+
     def io(self, idx: int) -> FragmentIO:
 
         if idx < 0:
@@ -87,10 +118,73 @@ class BlocksIndexedReader:
         if idx >= len(self):
             raise IndexError(f"Must not be larger than {len(self)}")
 
-        return FragmentIO(self.source_io,
-                          self._start_pos + idx * CLUSTER_SIZE,
-                          CLUSTER_SIZE)
+        start = self._start_pos + idx * CLUSTER_SIZE
+        mapped = self._mapped()
+        if mapped is not None:
+            # all the fragments share the same map, so the blocks are not
+            # copied until they are read
+            if self._mapped_io is None:
+                self._mapped_io = _MappedIO(mapped)
+            return FragmentIO(self._mapped_io, start, CLUSTER_SIZE)
+        return FragmentIO(self.source_io, start, CLUSTER_SIZE)
 
     def __iter__(self) -> Iterable[FragmentIO]:
         for i in range(len(self)):
             yield self.io(i)
+
+
+def _mmap_or_none(stream: BinaryIO) -> Optional[mmap.mmap]:
+    try:
+        fileno = stream.fileno()
+    except (OSError, NotImplementedError):
+        # BytesIO and other in-memory streams
+        return None
+    try:
+        return mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        # ValueError is raised for empty files
+        return None
+
+
+class _MappedIO(io.RawIOBase, BinaryIO):
+    """Read-only `BinaryIO` over a memory map.
+
+    The `mmap` object can read and seek itself, but it has no `readable`,
+    `seekable` and `writable` methods. The map is not closed by this
+    object: it is closed by the `BlocksIndexedReader` that created it."""
+
+    def __init__(self, mapped: mmap.mmap):
+        super().__init__()
+        self._map = mapped
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def writable(self) -> bool:
+        return False
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._map.tell()
+        elif whence == io.SEEK_END:
+            offset += len(self._map)
+        elif whence != io.SEEK_SET:
+            raise ValueError(whence)
+        self._map.seek(offset)
+        return offset
+
+    def tell(self) -> int:
+        return self._map.tell()
+
+    def read(self, size: Optional[int] = -1) -> bytes:
+        if size is None or size < 0:
+            return self._map.read()
+        return self._map.read(size)
+
+    def readinto(self, buffer) -> int:
+        data = self._map.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
@@ -2,10 +2,11 @@
 # SPDX-License-Identifier: MIT
 
 
-from typing import List, BinaryIO, Optional
+from typing import List, BinaryIO, Optional, Dict
 
 from dmk.a_base import CodenameKey
-from dmk.b_cryptoblobs import DecryptedIO
+from dmk.b_cryptoblobs import DecryptedIO, imprint_matches, \
+    NONCE_AND_IMPRINT_SIZE
 from dmk.b_storage_file import BlocksIndexedReader
 
 
@@ -17,6 +18,17 @@ class NameGroupItem:
         self.is_fake: bool = False
 
 
+def _has_all_parts(files_by_ver: List[NameGroupItem]) -> bool:
+    last_part_idx: Optional[int] = next(
+        (gf.dio.header.part_idx
+         for gf in files_by_ver
+         if gf.dio.header.is_last_part),
+        None
+    )
+    return last_part_idx is not None \
+           and last_part_idx == len(files_by_ver) - 1
+
+
 class NameGroup:
     """Inside the list of blobs, it detects those that are associated with
     the specified code name. It also finds out which of these blobs have
@@ -42,12 +54,24 @@ class NameGroup:
 
         self.items: List[NameGroupItem] = []
 
+        # the loop runs for every blob in the file, so we avoid attribute
+        # lookups inside it
+        blob_io = self.blobs.io
+        read_head = self.blobs.read_head
+        cnk = self.cnk
+        append_item = self.items.append
+
         for idx in range(len(self.blobs)):
-            input_io = self.blobs.io(idx)
-            assert input_io.tell() == 0
-            dio = DecryptedIO(self.cnk, input_io)
-            if not dio.belongs_to_namegroup:
+            # Most of the blobs belong to other names. We check the imprint
+            # in the first bytes of the blob before creating any objects
+            # for it
+            head = read_head(idx, NONCE_AND_IMPRINT_SIZE)
+            if not imprint_matches(cnk, head):
                 continue
+
+            input_io = blob_io(idx)
+            assert input_io.tell() == 0
+            dio = DecryptedIO(cnk, input_io, nonce_and_imprint=head)
             assert dio.belongs_to_namegroup
 
             # We have checked that the block belongs to this code name.
@@ -55,26 +79,26 @@ class NameGroup:
             # of the 256-bit private keys or the 256-bit imprints.
             # We believe that any of these collisions are impossible.
             #
-            # But if speed is not a priority, we can double-check our belief
-            # in the absence of imprint collisions.
-
-            if dio.contains_data:
-                # checking CRC-32 of the decrypted body is ok
-                assert dio.data is not None
-            else:
-                # already checked 48-bit decrypted constant content_ver is ok,
-                # just recheck the property returns none
-                assert dio.data is None
+            # The bodies are not decrypted here. The CRC-32 of a body is
+            # checked once, when the fresh content is decrypted by read_data.
 
-            gf = NameGroupItem(idx, dio)
-            self.items.append(gf)
+            append_item(NameGroupItem(idx, dio))
 
-        # Marking fakes
-        for f in self.items:
-            if not f.dio.contains_data:
-                f.is_fake = True
+        # Marking fakes and grouping content items by version (in one pass)
+        items_by_version: Dict[int, List[NameGroupItem]] = {}
+        for gf in self.items:
+            if not gf.dio.contains_data:
+                gf.is_fake = True
+                continue
+            assert not gf.is_fake
+            data_version = gf.dio.header.data_version
+            same_version = items_by_version.get(data_version)
+            if same_version is None:
+                items_by_version[data_version] = [gf]
             else:
-                assert not f.is_fake
+                same_version.append(gf)
+
+        self.all_content_versions = set(items_by_version)
 
         # Finding the latest content version
         #
@@ -94,28 +118,17 @@ class NameGroup:
         # next versions will update the file instead of rewriting it, and
         # and incomplete saving will be possible again.
 
-        all_content_files = [gf for gf in self.items if gf.dio.contains_data]
-        self.all_content_versions = set(gf.dio.header.data_version
-                                        for gf in all_content_files)
-
-        # trying versions from maximum to minimum
-        for ver in sorted(self.all_content_versions, reverse=True):
-            files_by_ver = [gf for gf in all_content_files
-                            if gf.dio.header.data_version == ver]
-            last_part_idx: Optional[int] = next(
-                (gf.dio.header.part_idx
-                 for gf in files_by_ver
-                 if gf.dio.header.is_last_part),
-                None
-            )
-            if last_part_idx is None:
+        fresh_version: Optional[int] = None
+        for ver, files_by_ver in items_by_version.items():
+            if fresh_version is not None and ver <= fresh_version:
                 continue
+            if _has_all_parts(files_by_ver):
+                fresh_version = ver
 
-            if last_part_idx == len(files_by_ver) - 1:
-                # okay, this is the fresh content with all parts
-                for gf in files_by_ver:
-                    gf.is_fresh_data = True
-                break
+        if fresh_version is not None:
+            # okay, this is the fresh content with all parts
+            for gf in items_by_version[fresh_version]:
+                gf.is_fresh_data = True
 
     def block_idx_to_item(self, idx: int) -> NameGroupItem:
         return next(gf for gf in self.items if gf.idx == idx)
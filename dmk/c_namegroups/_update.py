@@ -14,13 +14,6 @@ from dmk.c_namegroups._namegroup import NameGroup
 from dmk.c_namegroups.content_ver import increased_data_version
 
 
-def get_stream_size(stream: BinaryIO) -> int:
-    pos = stream.seek(0, io.SEEK_CUR)
-    result = stream.seek(0, io.SEEK_END)
-    stream.seek(pos, io.SEEK_SET)
-    return result
-
-
 def remove_random_items(source: Set[int],
                         min_to_delete=1,
                         max_to_delete=5) -> Set[int]:
@@ -5,6 +5,8 @@
 import io
 import unittest
 from io import BytesIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
 
 from dmk._common import CLUSTER_SIZE
 from dmk.a_utils.randoms import get_noncrypt_random_bytes
@@ -53,6 +55,7 @@ class TestBlobsListFile(unittest.TestCase):
                             self.assertEqual(reader.io(0).read(), a)
                             self.assertEqual(reader.io(1).read(), b)
 
+                        self.assertEqual(reader.read_head(1, 10), b[:10])
                         with self.assertRaises(IndexError):
                             reader.io(3)
 
@@ -81,6 +84,48 @@ class TestBlobsListFile(unittest.TestCase):
     #          self.assertEqual(reader.read_bytes(), None)
     #         self.assertEqual(reader.read_bytes(), None)
 
+    def test_file(self):
+        # reading a real file, that can be mapped to memory
+        header = b'header'
+        clusters = [get_noncrypt_random_bytes(CLUSTER_SIZE)
+                    for _ in range(3)]
+        with TemporaryDirectory() as tds:
+            file = Path(tds) / "blocks"
+            with file.open('wb') as f:
+                f.write(header)
+                writer = BlocksSequentialWriter(f)
+                for cluster in clusters:
+                    writer.write_bytes(cluster)
+                writer.write_tail()
+
+            with file.open('rb') as f:
+                f.seek(len(header), io.SEEK_SET)
+                with BlocksIndexedReader(f) as reader:
+                    self.assertEqual(len(reader), 3)
+                    for _ in range(2):
+                        self.assertEqual(reader.io(2).read(), clusters[2])
+                        self.assertEqual(reader.io(0).read(), clusters[0])
+                        self.assertEqual(reader.io(1).read(), clusters[1])
+                    self.assertEqual(reader.io(1).read(5), clusters[1][:5])
+                    self.assertEqual(reader.read_head(2, 7), clusters[2][:7])
+                    for i in range(len(reader)):
+                        fragment = reader.io(i)
+                        self.assertTrue(fragment.readable())
+                        self.assertTrue(fragment.seekable())
+                        self.assertFalse(fragment.writable())
+                    with self.assertRaises(IndexError):
+                        reader.read_head(3, 7)
+                # the stream is not closed by the reader
+                self.assertFalse(f.closed)
+
+    def test_empty_file(self):
+        with TemporaryDirectory() as tds:
+            file = Path(tds) / "empty"
+            file.write_bytes(b'')
+            with file.open('rb') as f, BlocksIndexedReader(f) as reader:
+                self.assertEqual(len(reader), 0)
+                self.assertEqual(list(reader), [])
+
     def test_empty_stream(self):
         with BytesIO() as empty_io:
             brr = BlocksIndexedReader(empty_io)
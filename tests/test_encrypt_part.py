@@ -6,6 +6,8 @@ import io
 import random
 import unittest
 from io import BytesIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
 
 from dmk._common import MAX_CLUSTER_CONTENT_SIZE, CLUSTER_SIZE, \
     CODENAME_LENGTH_BYTES
@@ -13,7 +15,9 @@ from dmk.a_base._05_codename import CodenameAscii
 from dmk.a_base._10_kdf import FasterKDF, CodenameKey
 from dmk.a_utils.randoms import get_noncrypt_random_bytes
 from dmk.b_cryptoblobs._20_encdec_part import Encrypt, \
-    DecryptedIO, is_content_io, is_fake_io
+    DecryptedIO, is_content_io, is_fake_io, get_stream_size, \
+    NONCE_AND_IMPRINT_SIZE
+from dmk.b_storage_file._10_fragment_io import FragmentIO
 from tests.common import testing_salt
 
 
@@ -106,6 +110,33 @@ class TestEncryptDecrypt(unittest.TestCase):
     def test_encdec_empty_data(self):
         self._encrypt_decrypt('empty', b'')
 
+    def test_read_data_twice(self):
+        # the body is not kept in DecryptedIO, so each call decrypts it again
+        body = get_noncrypt_random_bytes(1000)
+        fpk = CodenameKey('name', testing_salt)
+        with BytesIO() as encrypted_io:
+            Encrypt(fpk).io_to_io(BytesIO(body), encrypted_io)
+            encrypted_io.seek(0, io.SEEK_SET)
+            dio = DecryptedIO(fpk, encrypted_io)
+            self.assertEqual(dio.read_data(), body)
+            self.assertEqual(dio.read_data(), body)
+            self.assertEqual(dio.header.part_size, len(body))
+
+    def test_pre_read_nonce_and_imprint(self):
+        body = get_noncrypt_random_bytes(1000)
+        fpk = CodenameKey('name', testing_salt)
+        with BytesIO() as encrypted_io:
+            Encrypt(fpk).io_to_io(BytesIO(body), encrypted_io)
+            encrypted_io.seek(0, io.SEEK_SET)
+            head = encrypted_io.read(NONCE_AND_IMPRINT_SIZE)
+            encrypted_io.seek(0, io.SEEK_SET)
+            dio = DecryptedIO(fpk, encrypted_io, nonce_and_imprint=head)
+            self.assertTrue(dio.belongs_to_namegroup)
+            self.assertEqual(dio.read_data(), body)
+
+            with self.assertRaises(ValueError):
+                DecryptedIO(fpk, encrypted_io, nonce_and_imprint=head[:-1])
+
     #
     def test_encdec_part(self):
         dec = self._encrypt_decrypt('name', b'0123abc000',
@@ -254,6 +285,32 @@ class TestEncryptDecrypt(unittest.TestCase):
         return decrypted_part_content
 
 
+class TestStreamSize(unittest.TestCase):
+    def test_bytes_io(self):
+        with BytesIO(b'0123456789') as stream:
+            stream.seek(3, io.SEEK_SET)
+            self.assertEqual(get_stream_size(stream), 10)
+            self.assertEqual(stream.tell(), 3)
+            # the buffer is released, so the stream is still writable
+            stream.write(b'abcdefghij')
+            self.assertEqual(get_stream_size(stream), 13)
+
+    def test_file(self):
+        with TemporaryDirectory() as tds:
+            file = Path(tds) / "file"
+            file.write_bytes(b'0123456789')
+            with file.open('rb') as stream:
+                stream.seek(3, io.SEEK_SET)
+                self.assertEqual(get_stream_size(stream), 10)
+                self.assertEqual(stream.tell(), 3)
+
+    def test_fragment(self):
+        with BytesIO(b'0123456789') as underlying:
+            fragment = FragmentIO(underlying, 2, 5)
+            self.assertEqual(get_stream_size(fragment), 5)
+            self.assertEqual(fragment.tell(), 0)
+
+
 if __name__ == "__main__":
     unittest.main()
     # TestEncryptDecrypt()._encrypt_decrypt('abcdef', b'qwertyuiop',
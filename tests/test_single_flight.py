@@ -0,0 +1,97 @@
+# SPDX-FileCopyrightText: (c) 2021 Artёm IG <github.com/rtmigo>
+# SPDX-License-Identifier: MIT
+
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from dmk.a_utils.single_flight import SingleFlight
+
+
+def wait_for_waiters(sf: SingleFlight, key, waiters_num: int):
+    """Returns when `waiters_num` threads are waiting for the current
+    flight with the `key`. Called from inside the computation, so the flight
+    cannot finish before the other threads join it."""
+    deadline = time.monotonic() + 5
+    while True:
+        with sf._lock:
+            if sf._flights[key].waiters == waiters_num:
+                return
+        if time.monotonic() > deadline:
+            raise TimeoutError
+        time.sleep(0.001)
+
+
+class TestSingleFlight(unittest.TestCase):
+    def test_concurrent_calls_share_result(self):
+        sf = SingleFlight()
+        threads_num = 8
+        calls = []
+
+        def compute():
+            calls.append(1)
+            wait_for_waiters(sf, 'key', threads_num - 1)
+            return b'result'
+
+        with ThreadPoolExecutor(max_workers=threads_num) as executor:
+            futures = [executor.submit(sf.run, 'key', compute)
+                       for _ in range(threads_num)]
+            results = [f.result() for f in futures]
+
+        self.assertEqual(results, [b'result'] * threads_num)
+        self.assertEqual(len(calls), 1)
+
+    def test_failed_leader_is_replaced_by_one_waiter(self):
+        sf = SingleFlight()
+        threads_num = 8
+        calls = []
+        lock = threading.Lock()
+
+        def compute():
+            with lock:
+                calls.append(1)
+                call_num = len(calls)
+            if call_num == 1:
+                wait_for_waiters(sf, 'key', threads_num - 1)
+                raise ValueError
+            # the waiters of the failed flight joined the new one
+            wait_for_waiters(sf, 'key', threads_num - 2)
+            return b'result'
+
+        with ThreadPoolExecutor(max_workers=threads_num) as executor:
+            futures = [executor.submit(sf.run, 'key', compute)
+                       for _ in range(threads_num)]
+            errors = [f.exception() for f in futures]
+
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(sum(isinstance(e, ValueError) for e in errors), 1)
+        self.assertEqual(
+            [f.result() for f, e in zip(futures, errors) if e is None],
+            [b'result'] * (threads_num - 1))
+
+    def test_results_are_not_cached(self):
+        sf = SingleFlight()
+        counter = iter(range(100))
+        self.assertEqual(sf.run('key', lambda: next(counter)), 0)
+        self.assertEqual(sf.run('key', lambda: next(counter)), 1)
+
+    def test_different_keys(self):
+        sf = SingleFlight()
+        self.assertEqual(sf.run('a', lambda: 1), 1)
+        self.assertEqual(sf.run('b', lambda: 2), 2)
+
+    def test_exception(self):
+        sf = SingleFlight()
+
+        def fail():
+            raise ValueError
+
+        with self.assertRaises(ValueError):
+            sf.run('key', fail)
+        # the failed flight does not block the next calls
+        self.assertEqual(sf.run('key', lambda: 5), 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
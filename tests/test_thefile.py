@@ -5,10 +5,14 @@ import unittest
 from io import BytesIO
 from pathlib import Path
 from tempfile import TemporaryDirectory
+from unittest.mock import patch
 
+from dmk import _vault_file
 from dmk._vault_file import DmkFile
 from dmk.a_base._10_kdf import FasterKDF
 from dmk.a_utils.randoms import random_codename_fullsize
+from dmk.b_cryptoblobs._20_encdec_part import DecryptedIO, \
+    VerificationFailure
 from tests.common import gen_random_content, gen_random_names
 
 
@@ -73,6 +77,71 @@ class TestTheFile(unittest.TestCase):
                 for name, data in names_and_datas:
                     self.assertEqual(crypto_dir_b.get_bytes(name), data)
 
+    def test_get_to_file(self):
+        data = gen_random_content(min_size=1024 * 20, max_size=1024 * 30)
+        with TemporaryDirectory() as tds:
+            the_file = DmkFile(Path(tds) / "file.dat")
+            the_file.set_bytes("name", data)
+
+            target = Path(tds) / "target"
+            self.assertFalse(the_file.get_to_file("other", target))
+            self.assertFalse(target.exists())
+
+            self.assertTrue(the_file.get_to_file("name", target))
+            self.assertEqual(target.read_bytes(), data)
+
+    def test_get_to_file_failure_removes_target(self):
+        data = gen_random_content(min_size=1024 * 20, max_size=1024 * 30)
+        with TemporaryDirectory() as tds:
+            the_file = DmkFile(Path(tds) / "file.dat")
+            the_file.set_bytes("name", data)
+
+            original = DecryptedIO.read_data
+            calls = []
+
+            def failing_read_data(self_):
+                calls.append(1)
+                if len(calls) == 3:
+                    raise VerificationFailure("Body CRC mismatch.")
+                return original(self_)
+
+            target = Path(tds) / "target"
+            with patch.object(DecryptedIO, 'read_data', failing_read_data):
+                with self.assertRaises(VerificationFailure):
+                    the_file.get_to_file("name", target)
+
+            # the failure happened after some parts were already written
+            self.assertEqual(len(calls), 3)
+            self.assertFalse(target.exists())
+
+    def test_write_between_reads_changes_read_key(self):
+        with TemporaryDirectory() as tds:
+            the_file = DmkFile(Path(tds) / "file.dat")
+            the_file.set_bytes("name", b'old')
+
+            keys = []
+            original_run = _vault_file._inflight_reads.run
+
+            def recording_run(key, func):
+                keys.append(key)
+                return original_run(key, func)
+
+            with patch.object(_vault_file._inflight_reads, 'run',
+                              recording_run):
+                self.assertEqual(the_file.get_bytes("name"), b'old')
+                self.assertEqual(the_file.get_bytes("name"), b'old')
+                the_file.set_bytes("name", b'new')
+                self.assertEqual(the_file.get_bytes("name"), b'new')
+                self.assertEqual(the_file.get_bytes("other"), None)
+
+            self.assertEqual(len(keys), 4)
+            # reads of the same file version share the key
+            self.assertEqual(keys[0], keys[1])
+            # the write replaced the file
+            self.assertNotEqual(keys[1], keys[2])
+            # the names are in the key too
+            self.assertNotEqual(keys[2], keys[3])
+
 
 if __name__ == "__main__":
     unittest.main()